@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+# --                                                            ; {{{1
+#
+# File        : bench/history-search.py
+# Maintainer  : Felix C. Stegerman <flx@obfusk.net>
+# Date        : 2018-09-27
+#
+# Copyright   : Copyright (C) 2018  Felix C. Stegerman
+# Version     : v0.1.1
+# License     : GPLv3+
+#
+# --                                                            ; }}}1
+
+                                                                # {{{1
+r"""
+m-gui - History search benchmark
+
+Fills a History w/ HISTORY synthetic lines, then times searches as
+typed one character at a time (i.e. incrementally); fails if any
+search takes longer than MAXMS.
+
+  $ python3 bench/history-search.py
+"""
+                                                                # }}}1
+
+import importlib, random, sys, time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+m_gui = importlib.import_module("m-gui")
+
+MAXMS   = 50
+WORDS   = "the quick brown fox jumps over lazy dog episode season".split()
+QUERIES = ["season 3 episode", "abcdefgh", "zzz", "Fox Jumps"]
+
+def main():
+  rnd   = random.Random(1)
+  pick  = lambda xs, k: [ rnd.choice(xs) for _ in range(k) ]
+  lines = [ "{:6d} {} {}.mkv".format(i, " ".join(pick(WORDS, 4)),
+                                     "".join(pick("abcdefghij", 8)))
+            for i in range(m_gui.HISTORY) ]
+  h, t = m_gui.History(), time.perf_counter()
+  for i in range(0, len(lines), 1000): h.add(lines[i:i+1000])
+  print("add: {:.1f}ms for {} lines".format(
+    (time.perf_counter() - t) * 1000, len(h)))
+  worst = 0
+  for q in QUERIES:
+    for k in range(1, len(q) + 1):
+      t = time.perf_counter(); ms, complete = h.search(q[:k])
+      dt = (time.perf_counter() - t) * 1000; worst = max(worst, dt)
+    print("{!r:20} {:5}{} matches  last={:.1f}ms".format(
+      q, len(ms), "" if complete else "+", dt))
+  print("worst: {:.1f}ms (max. {}ms)".format(worst, MAXMS))
+  return 0 if worst <= MAXMS else 1
+
+if __name__ == "__main__": sys.exit(main())
+
+# vim: set tw=70 sw=2 sts=2 et fdm=marker :
@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+# --                                                            ; {{{1
+#
+# File        : bench/ui-latency.py
+# Maintainer  : Felix C. Stegerman <flx@obfusk.net>
+# Date        : 2018-09-27
+#
+# Copyright   : Copyright (C) 2018  Felix C. Stegerman
+# Version     : v0.1.1
+# License     : GPLv3+
+#
+# --                                                            ; }}}1
+
+                                                                # {{{1
+r"""
+m-gui - UI latency regression harness
+
+Runs the real App (under a virtual X server, see the bench_ui make
+target) w/ a stub m command and synthetic media directories, fires
+actions programmatically and measures:
+
+  * activate: time spent in the action callback itself;
+  * dialog:   action -> dialog shown (mapped);
+  * output:   action -> first terminal output of the command;
+  * exited:   action -> command exited;
+  * stalls:   main loop stalls (ticks late by more than STALL).
+
+Dialogs are answered automatically.  The results are written to a
+JSON report; pass a previous report as --baseline to check for
+regressions.
+
+  $ xvfb-run -a python3 bench/ui-latency.py --rounds 10
+  $ xvfb-run -a python3 bench/ui-latency.py --baseline old.json
+"""
+                                                                # }}}1
+
+# === imports ===
+
+import argparse, contextlib, importlib, json, os, shlex, statistics, \
+       sys, tempfile, time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+m_gui = importlib.import_module("m-gui")
+
+# === vars ===
+
+DESC        = "m-gui - UI latency regression harness"
+
+TICK        = 5       # ms
+POLL        = 10      # ms
+STALL       = 50      # ms
+HOLD        = 50      # ms before answering a dialog
+SETTLE      = 200     # ms between steps
+STEPTIMEOUT = 10      # s
+
+ROUNDS      = 5
+NDIRS       = 3
+NFILES      = 200
+NSUBDIRS    = 5
+THRESHOLD   = 1.5     # max. median ratio vs baseline
+
+REPORT      = "ui-latency.json"
+METRICS     = "activate dialog output exited".split()
+
+# action, events to wait for, dialog response
+STEPS = [
+  ("openbm"     , ["dialog"]                    , True ),
+  ("list"       , ["output", "exited"]          , None ),
+  ("list-nums"  , ["output", "exited"]          , None ),
+  ("pgup"       , []                            , None ),
+  ("top"        , []                            , None ),
+  ("pgdn"       , []                            , None ),
+  ("bottom"     , []                            , None ),
+  ("play"       , ["dialog", "output", "exited"], True ),
+  ("opensubdir" , ["dialog"]                    , False),
+  ("whatsnew"   , ["dialog"]                    , False),
+  ("dirup"      , []                            , None ),
+]
+
+                                                                # {{{1
+STUB = r"""
+#!/bin/bash
+set -e
+nums= args=()
+for a in "$@"; do
+  case "$a" in
+    --numbers) nums=yes ;;
+    --*) ;;
+    *) args+=( "$a" ) ;;
+  esac
+done
+set -- "${args[@]}"
+cmd="$1"; shift || true
+case "$cmd" in
+  ls)
+    i=0
+    for f in *; do
+      [ -f "$f" ] || continue; i=$(( i + 1 ))
+      if [ -n "$nums" ]; then printf '%4d   %s\n' "$i" "$f"
+      else printf '  %s\n' "$f"; fi
+    done
+    ;;
+  ld) for d in */; do echo "${d%/}"; done ;;
+  p|n|nn) echo "playing $*"; sleep 0.1 ;;
+  *) echo "m $cmd $*" ;;
+esac
+"""[1:]                                                         # }}}1
+
+# === bench ===
+
+class Bench:                                                    # {{{1
+  """Drives the App through STEPS and collects measurements."""
+
+  def __init__(self, app, *, rounds):
+    self.app, self.steps, self.results = app, iter(STEPS * rounds), []
+    self.step, self.last_tick, self.stalls = None, None, []
+    self.draining, self.firing, self.dialogs = False, False, set()
+
+  def start(self):
+    GLib.timeout_add(TICK, self.on_tick)
+    GLib.timeout_add(POLL, self.on_poll)
+    term = self.app.win.term
+    term.connect("contents-changed", self.on_contents_changed)
+    return False
+
+  def mark(self, event):
+    if self.step is not None and event not in self.step["t"]:
+      self.step["t"][event] = time.perf_counter()
+
+  # NB: activate_action may not return until a dialog is closed
+  def fire(self, name, waits, response):
+    self.stalls, t0 = [], time.perf_counter()
+    step = self.step = dict(action = name, waits = waits, t = {},
+                            response = response, t0 = t0, cursor = None)
+    self.firing = True
+    try:
+      self.app.activate_action(name, None)
+    finally:
+      self.firing = False
+    step["activate"] = time.perf_counter() - t0
+
+  def finish(self, timeout = False):
+    s, r = self.step, {}
+    r["action"], r["timeout"] = s["action"], timeout
+    if "activate" in s: r["activate"] = s["activate"]
+    for k in s["waits"]:
+      if k in s["t"]: r[k] = s["t"][k] - s["t0"]
+    r["stalls"], r["stall_max"] = len(self.stalls), max(self.stalls,
+                                                         default = 0)
+    self.results.append(r); self.step = None
+    if timeout:
+      m_gui.info("==> timeout:", r["action"])
+      for dialog in list(self.dialogs):
+        dialog.response(Gtk.ResponseType.CANCEL)
+      if self.app.child is not None: self.app.cancel_cmd(self.app.child)
+
+  def next(self):
+    step = next(self.steps, None)
+    if step is None:
+      self.app.quit()
+    else:
+      self.fire(*step)
+    return False
+
+  # NB: after a timeout, wait for the action to return and the
+  # cancelled command to go away (bounded by cancel_cmd), otherwise
+  # the next steps' actions are still disabled
+  def on_poll(self):
+    s = self.step
+    if self.draining:
+      if self.app.child is None and not self.firing:
+        self.draining = False
+        GLib.timeout_add(SETTLE, self.next)
+    elif s is not None:
+      if time.perf_counter() - s["t0"] > STEPTIMEOUT:
+        self.finish(timeout = True); self.draining = True
+      elif "activate" in s and self.app.child is None and \
+          all( k in s["t"] for k in s["waits"] ):
+        self.finish()
+        GLib.timeout_add(SETTLE, self.next)
+    return True
+
+  def on_tick(self):
+    t = time.perf_counter()
+    if self.last_tick is not None:
+      late = (t - self.last_tick) * 1000 - TICK
+      if late > STALL: self.stalls.append(late / 1000)
+    self.last_tick = t
+    return True
+
+  def on_cmd_spawned(self, pid):
+    if self.step is not None:
+      self.step["cursor"] = self.app.win.term.get_cursor_position()
+
+  def on_cmd_exited(self, _status):
+    self.mark("exited")
+
+  # NB: the header is fed before the command is spawned; only count
+  # changes that move the cursor after that
+  def on_contents_changed(self, term):
+    s = self.step
+    if s is not None and s["cursor"] is not None and \
+        term.get_cursor_position() != s["cursor"]:
+      self.mark("output")
+
+  def on_dialog_map(self, dialog, _event):
+    self.mark("dialog")
+    ok = self.step is not None and self.step["response"]
+    if ok and hasattr(dialog, "chooser"): dialog.chooser.set_active(0)
+    resp = Gtk.ResponseType.OK if ok else Gtk.ResponseType.CANCEL
+    GLib.timeout_add(HOLD, lambda: dialog.response(resp))
+    return False
+                                                                # }}}1
+
+def hook(app, bench):                                           # {{{1
+  """Wraps App callbacks and run_dialog to notify the bench."""
+
+  spawned, exited = app.on_cmd_spawned, app.on_cmd_exited
+  def on_cmd_spawned(pid):
+    spawned(pid); bench.on_cmd_spawned(pid)
+  def on_cmd_exited(status):
+    exited(status); bench.on_cmd_exited(status)
+  app.on_cmd_spawned, app.on_cmd_exited = on_cmd_spawned, on_cmd_exited
+
+  orig_run_dialog = m_gui.run_dialog
+  @contextlib.contextmanager
+  def run_dialog(dialog):
+    dialog.connect("map-event", bench.on_dialog_map)
+    bench.dialogs.add(dialog)
+    try:
+      with orig_run_dialog(dialog) as ok: yield ok
+    finally:
+      bench.dialogs.discard(dialog)
+  m_gui.run_dialog = run_dialog
+                                                                # }}}1
+
+# === functions ===
+
+def setup(tmp):                                                 # {{{1
+  """Creates the stub m command and synthetic media directories."""
+
+  stub = tmp / "m-stub"
+  stub.write_text(STUB); stub.chmod(0o755)
+  dirs = []
+  for i in range(NDIRS):
+    d = tmp / "media" / "dir{:02d}".format(i); dirs.append(str(d))
+    for j in range(NSUBDIRS):
+      (d / "sub{:02d}".format(j)).mkdir(parents = True)
+    for j in range(NFILES):
+      (d / "episode-{:04d}.mkv".format(j)).touch()
+  cfg = m_gui.default_config()
+  cfg.update(m_command = shlex.quote(str(stub)), bookmarks = dirs,
+             m_options = dict(colour = False))
+  return cfg, dirs[0]
+                                                                # }}}1
+
+def summary(results):                                           # {{{1
+  out = {}
+  for r in results:
+    a = out.setdefault(r["action"], dict(n = 0, timeouts = 0,
+                                         stalls = 0, stall_max = 0))
+    a["n"] += 1; a["timeouts"] += r["timeout"]
+    a["stalls"] += r["stalls"]
+    a["stall_max"] = max(a["stall_max"], r["stall_max"])
+    for k in METRICS:
+      if k in r: a.setdefault(k, []).append(r[k])
+  for a in out.values():
+    for k in METRICS:
+      if k in a:
+        xs = sorted(a[k])
+        a[k] = dict(median = statistics.median(xs), max = xs[-1])
+  return out
+                                                                # }}}1
+
+def compare(summ, base, threshold):                             # {{{1
+  """Prints median ratios vs baseline; returns True if OK."""
+  ok = True
+  for action, a in sorted(summ.items()):
+    for k in METRICS:
+      if k in a and k in base.get(action, {}):
+        old, new = base[action][k]["median"], a[k]["median"]
+        ratio = new / old if old else 1.0
+        bad   = ratio > threshold and new - old > STALL / 1000
+        ok    = ok and not bad
+        print("{:12} {:9} {:8.1f}ms -> {:8.1f}ms  x{:.2f}{}".format(
+          action, k, old * 1000, new * 1000, ratio,
+          "  REGRESSION" if bad else ""
+        ))
+  return ok
+                                                                # }}}1
+
+def print_summary(summ):                                        # {{{1
+  for action, a in sorted(summ.items()):
+    ms = "  ".join( "{}={:.1f}/{:.1f}ms".format(
+                      k, a[k]["median"] * 1000, a[k]["max"] * 1000)
+                    for k in METRICS if k in a )
+    print("{:12} n={} timeouts={} stalls={} stall_max={:.1f}ms  {}"
+          .format(action, a["n"], a["timeouts"], a["stalls"],
+                  a["stall_max"] * 1000, ms))
+                                                                # }}}1
+
+def main(*args):                                                # {{{1
+  global GLib, Gtk
+  n = _argument_parser().parse_args(args)
+  output    = Path(n.output).resolve()
+  baseline  = n.baseline and Path(n.baseline).resolve()
+  if not os.environ.get("DISPLAY"):
+    m_gui.info("==> no $DISPLAY; run under xvfb-run"); return 1
+  m_gui.import_gtk(n.scale); m_gui.define_classes()
+  from gi.repository import GLib, Gtk
+  with tempfile.TemporaryDirectory() as tmp:
+    cfg, start = setup(Path(tmp)); m_gui.chdir(start)
+    app   = m_gui.App(cfg)
+    bench = Bench(app, rounds = n.rounds); hook(app, bench)
+    def on_activate(_app):
+      GLib.idle_add(bench.start)
+      GLib.timeout_add(SETTLE, bench.next)
+    app.connect_after("activate", on_activate)
+    print("==> running {} round(s)...".format(n.rounds))
+    app.run(None)
+  summ = summary(bench.results)
+  with output.open("w") as f:
+    json.dump(dict(results = bench.results, summary = summ), f,
+              indent = 2, sort_keys = True)
+    f.write("\n")
+  print_summary(summ)
+  if baseline:
+    with baseline.open() as f: base = json.load(f)["summary"]
+    if not compare(summ, base, n.threshold): return 1
+  return 0
+                                                                # }}}1
+
+def _argument_parser():                                         # {{{1
+  p = argparse.ArgumentParser(description = DESC)
+  p.add_argument("--rounds", "-n", metavar = "N", type = int,
+                 default = ROUNDS, help = "run all steps N times")
+  p.add_argument("--output", "-o", metavar = "FILE", default = REPORT,
+                 help = "write JSON report to FILE")
+  p.add_argument("--baseline", "-b", metavar = "FILE",
+                 help = "compare against previous report FILE")
+  p.add_argument("--threshold", metavar = "RATIO", type = float,
+                 default = THRESHOLD,
+                 help = "max. ratio of medians vs baseline")
+  p.add_argument("--scale", "-s", metavar = "SCALE", type = float,
+                 default = 1.0, help = "set $GDK_DPI_SCALE to SCALE")
+  return p
+                                                                # }}}1
+
+# === run ===
+
+if __name__ == "__main__": sys.exit(main(*sys.argv[1:]))
+
+# vim: set tw=70 sw=2 sts=2 et fdm=marker :
@@ -23,7 +23,8 @@ See README.md for additional information and examples.
 
 # === imports ===
 
-import argparse, contextlib, json, os, re, subprocess, sys, time
+import argparse, bisect, collections, contextlib, itertools, json, \
+       locale, os, queue, re, signal, subprocess, sys, threading, time
 import xml.etree.ElementTree as ET
 
 from pathlib import Path
@@ -53,6 +54,28 @@ SCALE       = 1.5
 SCROLLBACK  = 1024
 COMBOWRAP   = 80
 
+WORKERS       = 2
+WAITS         = 100   # wait times kept for stats
+PRIO_USER     = 0
+PRIO_PREFETCH = 10
+
+LISTTIMEOUT = 30      # seconds
+LISTPOLL    = 0.1     # seconds between checks for cancellation
+
+AGGWORKERS  = 4
+AGGTIMEOUT  = 30      # seconds per directory
+AGGSIZE     = (960, 540)
+
+HISTORY     = 500000  # lines of output kept for searching
+HISTCHUNK   = 4096    # lines per chunk
+MAXMATCHES  = 1000
+
+# PCRE2_CASELESS | PCRE2_MULTILINE
+PCRE2FLAGS  = 0x00000008 | 0x00000400
+
+CANCELSIGS  = [signal.SIGINT, signal.SIGTERM, signal.SIGKILL]
+CANCELWAIT  = 2       # seconds between signals
+
 # NB: we run a login shell b/c we need /etc/profile.d/vte-2.91.sh to
 # be sourced for current_directory_uri to work.
 SHELL       = "bash"                                            # TODO
@@ -123,7 +146,8 @@ def default_config():                                           # {{{1
                 "#3465a4:#75507b:#06989a:#d3d7cf:#555753:#ef2929:"
                 "#8ae234:#fce94f:#729fcf:#ad7fa8:#34e2e2:#eeeeec",
     scale = SCALE, fullscreen = False, stay_fullscreen = False,
-    mod = "Shift", bookmarks = []
+    mod = "Shift", bookmarks = [], timeouts = {},
+    marks = dict(new = " ", playing = ">", done = "*", skip = "~")
   )
                                                                 # }}}1
 
@@ -147,6 +171,187 @@ def user_config_file(): return HOME / CFG / GUICFGFILE
 
 # === classes ===
 
+class Cancelled(Exception):
+  """Job was cancelled."""
+
+class Token:
+  """Cancellation token."""
+
+  def __init__(self): self.cancelled = False
+  def cancel(self):   self.cancelled = True
+
+class Job:
+  """Scheduler job."""
+
+  def __init__(self, key, f, prio, token):
+    self.key, self.f, self.prio, self.token = key, f, prio, token
+    self.callbacks, self.started, self.queued = [], False, time.time()
+
+class Scheduler:                                                # {{{1
+  """
+  Prioritised thread pool for background work; completion callbacks
+  are run in the main loop (using idle_add).
+  """
+
+  def __init__(self, idle_add, *, workers = WORKERS, debug = False):
+    self.idle_add, self.debug = idle_add, debug
+    self.queue, self.lock     = queue.PriorityQueue(), threading.Lock()
+    self.jobs, self.token     = {}, Token()
+    self.seq, self.running    = itertools.count(), 0
+    self.waits                = collections.deque(maxlen = WAITS)
+    for _ in range(workers):
+      threading.Thread(target = self._work, daemon = True).start()
+
+  def submit(self, key, f, done = None, *, prio = PRIO_USER,
+             token = None):
+    """
+    Run f(token) in a worker thread and done(result) in the main
+    loop; long-running jobs can stop early when token.cancelled.
+
+    Jobs with the same key as an in-flight job are deduplicated (the
+    callback is added to the existing job, which is requeued if the
+    new priority is higher).  Jobs are cancelled by cancel() unless
+    they were given their own token.
+    """
+    with self.lock:
+      job = self.jobs.get(key)
+      if job is None or job.token.cancelled:
+        job = self.jobs[key] = Job(key, f, prio, token or self.token)
+        self._put(job)
+      elif prio < job.prio and not job.started:
+        job.prio = prio; self._put(job)
+      if done: job.callbacks.append(done)
+      return job
+
+  def cancel(self):
+    """Cancel all jobs using the default token (e.g. on chdir)."""
+    with self.lock:
+      self.token.cancel(); self.token = Token()
+
+  def stats(self):
+    """Queue depth and wait times (in seconds)."""
+    with self.lock:
+      waits = list(self.waits)
+      return dict(
+        queued    = sum( not j.started for j in self.jobs.values() ),
+        running   = self.running,
+        wait_avg  = sum(waits) / len(waits) if waits else 0,
+        wait_max  = max(waits, default = 0),
+      )
+
+  def _put(self, job):
+    self.queue.put((job.prio, next(self.seq), job))
+
+  # NB: a requeued job has stale entries in the queue; skip those
+  def _work(self):
+    while True:
+      prio, _, job = self.queue.get()
+      with self.lock:
+        if job.started or prio != job.prio: continue
+        job.started = True
+        if job.token.cancelled:
+          self.idle_add(self._done, job, None, None); continue
+        self.running += 1
+        self.waits.append(time.time() - job.queued)
+      res, exc = None, None
+      try:
+        res = job.f(job.token)
+      except Exception as e:
+        exc = e
+      with self.lock: self.running -= 1
+      self.idle_add(self._done, job, res, exc)
+
+  def _done(self, job, res, exc):
+    with self.lock:
+      if self.jobs.get(job.key) is job: del self.jobs[job.key]
+    if self.debug: info("==> job", repr(job.key), self.stats())
+    if exc is not None:
+      if not job.token.cancelled:
+        info("==> job {!r} failed: {}".format(job.key, exc))
+    else:
+      for cb in job.callbacks:
+        if job.token.cancelled: break   # e.g. by an earlier callback
+        cb(res)
+    return False
+                                                                # }}}1
+
+class History:                                                  # {{{1
+  """
+  Captured (terminal) output w/ fast incremental search.
+
+  Lines are stored in chunks (w/ their lowercased text, joined) so
+  searching is mostly str.find() in C.  Lines have consecutive numbers
+  that stay valid when old chunks are dropped.  The last search is
+  cached: when the query is repeated or extended, only its matches and
+  the lines added since are scanned.
+  """
+
+  def __init__(self, *, maxlines = HISTORY, chunk = HISTCHUNK):
+    self.maxlines, self.chunk, self.chunks, self.buf = \
+      maxlines, chunk, [], []
+    self.first, self.end, self.cache = 0, 0, None
+
+  def __len__(self): return self.end - self.first
+
+  def add(self, lines):
+    self.buf.extend(lines); self.end += len(lines)
+    while len(self.buf) >= self.chunk:
+      self._freeze(self.buf[:self.chunk])
+      self.buf = self.buf[self.chunk:]
+    while self.chunks and \
+        len(self) - len(self.chunks[0][3]) >= self.maxlines:
+      self.first += len(self.chunks.pop(0)[3])
+
+  def line(self, n):
+    """Returns line n (or None if not (or no longer) available)."""
+    if not self.first <= n < self.end: return None
+    for first, lines, _, _ in self.chunks:
+      if n < first + len(lines): return lines[n - first]
+    return self.buf[n - (self.end - len(self.buf))]
+
+  def search(self, query, limit = MAXMATCHES):
+    """
+    Returns the numbers of the lines matching query (ignoring case)
+    and whether that list is complete (i.e. not truncated at limit).
+    """
+    q = query.lower()
+    if not q: return [], True
+    c = self.cache
+    if c and c[2] and q.startswith(c[0]):
+      ms  = [ n for n in c[1] if n >= self.first
+                              and q in self.line(n).lower() ]
+      frm = c[3]
+    else:
+      ms, frm = [], self.first
+    complete    = self._scan(q, max(frm, self.first), ms, limit)
+    self.cache  = (q, ms, complete, self.end)
+    return list(ms), complete
+
+  # NB: lowercasing can change the length of a string (e.g. "İ"), so
+  # the offsets must be those of the lowercased lines
+  def _freeze(self, lines):
+    first, starts, i = self.end - len(self.buf), [], 0
+    lower = [ x.lower() for x in lines ]
+    for x in lower: starts.append(i); i += len(x) + 1
+    self.chunks.append((first, lines, "\n".join(lower), starts))
+
+  def _scan(self, q, frm, ms, limit):
+    for first, _, lower, starts in self.chunks:
+      if first + len(starts) <= frm: continue
+      i = lower.find(q, starts[max(frm - first, 0)])
+      while i != -1:
+        if len(ms) >= limit: return False
+        k = bisect.bisect_right(starts, i) - 1; ms.append(first + k)
+        if k + 1 >= len(starts): break
+        i = lower.find(q, starts[k+1])
+    n0 = self.end - len(self.buf)
+    for k, x in enumerate(self.buf):
+      if n0 + k >= frm and q in x.lower():
+        if len(ms) >= limit: return False
+        ms.append(n0 + k)
+    return True
+                                                                # }}}1
+
 def define_classes():
   global Term, AppWin, App
 
@@ -160,8 +365,11 @@ def define_classes():
                  colours = None, **kwargs):
       super().__init__(**kwargs)
       self.set_scrollback_lines(SCROLLBACK)
+      self.search_set_wrap_around(True)
+      self.history, self.hrow = History(), 0
       self.connect("child-exited", self.on_child_exited)
       self.connect("current-directory-uri-changed", self.on_cdu_changed)
+      self.connect("contents-changed", lambda _: self.capture())
       self.spawned_callback = spawned_callback
       self.exited_callback  = exited_callback
       self.chdir_callback   = chdir_callback
@@ -176,7 +384,34 @@ def define_classes():
       time.sleep(0.2)   # seems to help
 
     def clear(self):
+      col, row = self.get_cursor_position()
+      self.capture(row + 1 if col else row)
       self.reset(False, True)
+      self.hrow = self.get_cursor_position()[1]
+
+    # NB: rows that scrolled out of the scrollback before we got to see
+    # them are lost; contents-changed is emitted often enough for that
+    # not to happen in practice
+    def capture(self, upto = None):
+      """Adds rows completed since the last capture to the history."""
+      row = self.get_cursor_position()[1] if upto is None else upto
+      frm = max(self.hrow, int(self.props.vadjustment.get_lower()))
+      if row > frm:
+        text, _ = self.get_text_range(frm, 0, row - 1,
+                                      self.get_column_count(), None,
+                                      None)
+        lines = text.split("\n")
+        if lines[-1] == "": lines.pop()
+        self.history.add(lines)
+      self.hrow = max(self.hrow, row)
+
+    def search(self, text):
+      """Sets (or clears) the text to search for in the scrollback."""
+      if text:
+        regex = Vte.Regex.new_for_search(re.escape(text), -1, PCRE2FLAGS)
+        self.search_set_regex(regex, 0)
+      else:
+        self.search_set_regex(None, 0)
 
     def header(self, text):
       self.feed(text.replace("\n", "\r\n").encode())
@@ -209,10 +444,33 @@ def define_classes():
       self.cwd_lbl  = Gtk.Label(label = cwd())
       self.term     = Term(**term_args)
       self.cwd_lbl.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+      self.search_entry = Gtk.SearchEntry()
+      self.search_lbl   = Gtk.Label()
+      self.search_bar   = Gtk.SearchBar()
+      sbox = Gtk.Box(spacing = 6)
+      sbox.pack_start(self.search_entry, True , True, 0)
+      sbox.pack_start(self.search_lbl  , False, True, 0)
+      self.search_bar.add(sbox)
+      self.search_bar.connect_entry(self.search_entry)
+      self.search_bar.set_show_close_button(True)
+      self.search_bar.connect("notify::search-mode-enabled",
+                              self.on_search_mode)
       box = Gtk.Box(orientation = Gtk.Orientation.VERTICAL)
-      box.pack_start(self.cwd_lbl, False, True, 0)
-      box.pack_start(self.term   , True , True, 0)
+      box.pack_start(self.cwd_lbl   , False, True, 0)
+      box.pack_start(self.search_bar, False, True, 0)
+      box.pack_start(self.term      , True , True, 0)
       self.add(box)
+      self.connect("key-press-event", self.on_key_press)
+
+    # NB: the search entry needs to see keys before the (single-key)
+    # accelerators do
+    def on_key_press(self, _widget, event):
+      if self.search_entry.has_focus():
+        return self.propagate_key_event(event)
+      return False
+
+    def on_search_mode(self, bar, _param):
+      if not bar.get_search_mode(): self.term.grab_focus()
                                                                 # }}}1
 
   class ComboBoxDialog(Gtk.Dialog):                             # {{{1
@@ -271,16 +529,92 @@ def define_classes():
         return ok and self.entry.get_text()
                                                                 # }}}1
 
+  class AggregateDialog(Gtk.Dialog):                            # {{{1
+    """Aggregate listing (grouped by directory) dialog."""
+
+    def __init__(self, parent, title, *, status = "new"):
+      super().__init__(title = title, transient_for = parent)
+      self.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                       Gtk.STOCK_OK, Gtk.ResponseType.OK)
+      self.set_default_size(*AGGSIZE)
+      self.store  = Gtk.TreeStore(str, int, str, str)   # dir,i,status,text
+      self.status = Gtk.ComboBoxText()
+      for x in MSPEC: self.status.append(x, x)
+      self.status.set_active_id(status)
+      self.status.connect("changed", lambda _: self.filter.refilter())
+      self.filter = self.store.filter_new()
+      self.filter.set_visible_func(self._visible)
+      self.view   = Gtk.TreeView.new_with_model(self.filter)
+      self.view.set_headers_visible(False)
+      self.view.get_style_context().add_class("monospace")
+      self.view.append_column(Gtk.TreeViewColumn(
+        None, Gtk.CellRendererText(), text = 3
+      ))
+      self.view.connect("row-activated", self.on_row_activated)
+      scroll = Gtk.ScrolledWindow(); scroll.add(self.view)
+      area = self.get_content_area()
+      area.pack_start(self.status, False, True, 0)
+      area.pack_start(scroll     , True , True, 0)
+      self.set_default_response(Gtk.ResponseType.OK)
+      self.show_all()
+
+    # NB: blank lines are skipped, but the indices stay those of the
+    # listing so they match m's numbering
+    def add_dir(self, d, files, error = None):
+      """Adds the (status, line) listing of directory d."""
+      n       = sum( 1 for _, line in files if line )
+      note    = error or "{} file(s)".format(n)
+      parent  = self.store.append(None, [d, -1, "", "{}  ({})"
+                                         .format(d, note)])
+      w = len(str(len(files)))
+      for i, (status, line) in enumerate(files):
+        if not line: continue
+        self.store.append(parent, [d, i, status or "", "{:{w}d} {}"
+                                   .format(i+1, line, w = w)])
+      path = self.filter.convert_child_path_to_path(
+        self.store.get_path(parent)
+      )
+      if path is not None: self.view.expand_row(path, False)
+
+    # NB: directory rows are expanded/collapsed, file rows chosen
+    def on_row_activated(self, view, path, _column):
+      if view.get_model()[path][1] >= 0:
+        self.response(Gtk.ResponseType.OK)
+      elif view.row_expanded(path):
+        view.collapse_row(path)
+      else:
+        view.expand_row(path, False)
+
+    def _visible(self, model, it, _data):
+      status = self.status.get_active_id()
+      return model[it][1] < 0 or status == "all" or \
+             model[it][2] == status
+
+    def ask(self):
+      """Runs the dialog and returns the selected (dir, index) or None."""
+      with run_dialog(self) as ok:
+        if ok:
+          model, it = self.view.get_selection().get_selected()
+          if it is not None and model[it][1] >= 0:
+            return model[it][0], model[it][1]
+        return None
+                                                                # }}}1
+
   class App(Gtk.Application):                                   # {{{1
     """Main application."""
 
     # TODO: Gio.ApplicationFlags.HANDLES_COMMAND_LINE ?
     def __init__(self, cfg, *, fullscreen = False,
-                 stay_fullscreen = False, **kwargs):
+                 stay_fullscreen = False, debug = False, **kwargs):
       super().__init__(application_id = APPID,
                        flags = Gio.ApplicationFlags.NON_UNIQUE,
                        **kwargs)
       self.win, self.actions, self.noquit = None, [], False
+      self.child, self.timeout_id, self.cancelling = None, None, None
+      self.sched = Scheduler(GLib.idle_add, debug = debug)
+      self.subdirs_cache = None
+      self.agg_sched = Scheduler(GLib.idle_add, workers = AGGWORKERS,
+                                 debug = debug)
       self.cfg, self.is_fs, self.stay_fs, self.start_fs \
         = cfg, False, stay_fullscreen, fullscreen
       self.cfg["bookmarks"] = set(self.cfg["bookmarks"])        # TODO
@@ -297,6 +631,7 @@ def define_classes():
           self.add_simple_action(name, getattr(self, cb))
         else:
           self.add_simple_action(name, self.on_run_script(name))
+      self.lookup_action("cancel").set_enabled(False)
       provider = Gtk.CssProvider()
       Gtk.StyleContext().add_provider_for_screen(
         Gdk.Screen.get_default(), provider,
@@ -322,7 +657,12 @@ def define_classes():
       self.win  = AppWin(application = self, title = DESC,
                          term_args = term_args)
       self.win.connect("window-state-event", self.on_window_state_event)
+      self.win.search_entry.connect("search-changed",
+                                    self.on_search_changed)
+      self.win.search_entry.connect("activate", lambda _:
+                                    self.search_jump(True))
       self.win.show_all()
+      self.fetch_subdirs(prio = PRIO_PREFETCH)
                                                                 # }}}2
 
     def do_activate(self):
@@ -333,7 +673,25 @@ def define_classes():
       self.win.present()
 
     def on_opensubdir(self, _action, _param):
-      self._choose(self.choose_subdir)
+      c = self.subdirs_cache
+      if c and c[0] == cwd() and c[1] == mtime(c[0]):
+        self._choose_subdir(c[2])
+      else:
+        self.fetch_subdirs(self._choose_subdir)
+
+    def _choose_subdir(self, data):
+      self._choose(lambda: self.choose_subdir(data))
+
+    # NB: the result is cached (until the next chdir or command, or
+    # the directory's mtime changes); we prefetch after chdir etc.
+    def fetch_subdirs(self, done = None, *, prio = PRIO_USER):
+      d, hidden = cwd(), self.cfg["m_options"].get("show-hidden")
+      def f(res):
+        self.subdirs_cache = (d,) + res
+        if done: done(res[1])
+      self.sched.submit(("subdirs", d),
+                        lambda _: (mtime(d), subdirs(d, hidden)), f,
+                        prio = prio)
 
     def on_opendir(self, _action, _param):
       self._choose(self.choose_folder)
@@ -352,6 +710,31 @@ def define_classes():
       self.win.term.clear()
       self.win.term.header("# " + msg + "\n")
 
+    # NB: runs _list in all bookmarked directories (concurrently, w/ a
+    # timeout) and shows the results as they come in
+    def on_whatsnew(self, _action, _param):                     # {{{2
+      dialog  = AggregateDialog(self.win, "What's new")
+      cmd     = command(self.cfg, "_list", colour = False)
+      token   = Token()
+      def add(d, res):
+        files, e = res
+        err = e and ("timeout" if isinstance(e, subprocess.TimeoutExpired)
+                     else "error: {}".format(e))
+        files = [ (file_status(self.cfg, x), x) for x in files ]
+        dialog.add_dir(d, files, err)
+      for d in sorted(self.cfg["bookmarks"]):
+        self.agg_sched.submit(
+          ("list", d),
+          lambda token, d = d: try_list_files(cmd, d, AGGTIMEOUT, token),
+          lambda res, d = d: add(d, res), token = token
+        )
+      ans = dialog.ask(); token.cancel()
+      if ans is not None:
+        d, i = ans
+        self.chdir_as_cmd(d)
+        self._run_cmd("play", lambda _: str(i+1))
+                                                                # }}}2
+
     def _choose(self, f):
       d = f()
       if d is not None: self.chdir_as_cmd(d)
@@ -360,6 +743,9 @@ def define_classes():
       self.noquit = True
       self.win.term.sh()
 
+    def on_cancel(self, _action, _param):
+      if self.child is not None: self.cancel_cmd(self.child)
+
     def on_quit(self, _action, _param):
       self.quit()
 
@@ -384,6 +770,47 @@ def define_classes():
     def on_bottom(self, _action, _param):
       self._scroll(lambda v, _: v.get_upper())
 
+    def on_search(self, _action, _param):
+      self.win.search_bar.set_search_mode(True)
+      self.win.search_entry.grab_focus()
+
+    def on_searchnext(self, _action, _param):
+      self.search_jump(True)
+
+    def on_searchprev(self, _action, _param):
+      self.search_jump(False)
+
+    def on_search_changed(self, entry):
+      text = entry.get_text(); self.win.term.search(text)
+      self.search_jump(False)
+
+    # NB: the history also has the output that scrolled out of the
+    # terminal's scrollback; searching for the chosen line jumps to it
+    # if it's (still) in the scrollback
+    def on_searchhistory(self, _action, _param):
+      term, text = self.win.term, self.win.search_entry.get_text()
+      term.capture(); ms, _ = term.history.search(text)
+      lines = [ term.history.line(n) for n in ms ]
+      line  = self._combo_ask("Matching lines", lines)
+      if line is not None:
+        self.win.search_bar.set_search_mode(True)
+        self.win.search_entry.set_text(line)
+
+    def search_jump(self, forward):                             # {{{2
+      term, text = self.win.term, self.win.search_entry.get_text()
+      if not text:
+        self.win.search_lbl.set_text(""); return
+      found = term.search_find_next() if forward \
+                else term.search_find_previous()
+      term.capture(); ms, complete = term.history.search(text)
+      self.win.search_lbl.set_text(
+        "{}; {}{} line(s) in history".format(
+          "found" if found else "not in scrollback", len(ms),
+          "" if complete else "+"
+        )
+      )
+                                                                # }}}2
+
     def _scroll(self, f):
       v = self.win.term.props.vadjustment
       v.set_value(f(v, v.get_value()))
@@ -396,33 +823,73 @@ def define_classes():
 
     def on_cmd_spawned(self, pid):
       # info("*** SPAWN ***", "pid =", pid)
+      self.sched.cancel(); self.subdirs_cache = None
+      self.child, self.cancelling = pid, None
       for action in self.actions:
-        if self.noquit or action.get_name() != "quit":
+        if action.get_name() == "cancel":
+          action.set_enabled(not self.noquit)   # not for the shell
+        elif self.noquit or action.get_name() != "quit":
           action.set_enabled(False)
       self.noquit = False
 
     def on_cmd_exited(self, status):
       # info("*** EXIT ***", "status =", status)
+      self.child = None
+      if self.timeout_id is not None:
+        GLib.source_remove(self.timeout_id); self.timeout_id = None
       for action in self.actions:
-        action.set_enabled(True)
+        action.set_enabled(action.get_name() != "cancel")
       if self.stay_fs: self.win.fullscreen()
+      self.fetch_subdirs(prio = PRIO_PREFETCH)
+
+    def on_cmd_timeout(self, pid):
+      self.timeout_id = None
+      if self.child == pid:
+        info("==> timeout, cancelling pid", pid)
+        self.cancel_cmd(pid)
+      return False
+
+    # NB: the child is a session leader (setsid by VTE), so its pid is
+    # also the id of its process group.
+    def cancel_cmd(self, pid):                                  # {{{2
+      """
+      Signal the process group of the running command: SIGINT, then
+      SIGTERM, then SIGKILL; if the child still hasn't exited after
+      that, give up waiting for it so the GUI becomes usable again.
+      """
+      if self.cancelling == pid: return
+      self.cancelling, sigs = pid, list(CANCELSIGS)
+      def f():
+        if self.child != pid: return False
+        if not sigs:
+          info("==> giving up on pid", pid)
+          self.on_cmd_exited(None); return False
+        sig = sigs.pop(0)
+        print("$ kill -{} -{}".format(sig.name, pid))
+        with contextlib.suppress(ProcessLookupError):
+          os.killpg(pid, sig)
+        return True
+      if f(): GLib.timeout_add_seconds(CANCELWAIT, f)
+                                                                # }}}2
 
     def on_window_state_event(self, _widget, event):
       self.is_fs = bool(event.new_window_state &
                         Gdk.WindowState.FULLSCREEN)
 
     def chdir(self, d):
+      self.sched.cancel(); self.subdirs_cache = None
       chdir(d)
       print("$ cd", d)
       self.win.cwd_lbl.set_text(cwd())
+      self.fetch_subdirs(prio = PRIO_PREFETCH)
 
     def chdir_as_cmd(self, d):
       self.chdir(d)
       self.win.term.clear()
       self.win.term.run_header("cd " + d)
 
-    def choose_subdir(self):
-      d = self._combo_ask("Please choose a subdirectory", self.subdirs())
+    def choose_subdir(self, data):
+      d = self._combo_ask("Please choose a subdirectory", data)
       return d and str(cwd() / Path(d))
 
     def choose_folder(self):                                    # {{{2
@@ -448,8 +915,8 @@ def define_classes():
       ans = ComboBoxDialog(self.win, title, store, monospace = True).ask()
       return None if ans is None else data[ans[0]]
 
-    def choose_filespec(self, name):                            # {{{2
-      files, store = self.list(), Gtk.ListStore(int, str)
+    def choose_filespec(self, files, name):                     # {{{2
+      store = Gtk.ListStore(int, str)
       n, m = len(files), len(MSPEC); w = len(str(n-1))
       for i, x in enumerate(files):
         store.append([i, "{:{w}d} {}".format(i+1, x, w = w)])
@@ -469,28 +936,37 @@ def define_classes():
       return None
                                                                 # }}}2
 
+    # NB: the file listing is only needed (and run in the background)
+    # if the script has a #{FILESPEC}
     def run_cmd(self, name):
-      cmd = command_w_filespec(self.cfg, name, self.choose_filespec)
-      if cmd is not None: self.win.term.sh(cmd)
-
-    def subdirs(self):
-      d = Path(cwd())
-      return sorted(
-        ( x.name for x in self._iterdir(d) if x.is_dir() ),
-        key = lambda x: x.lower()                               # TODO
+      if "#{FILESPEC}" not in command(self.cfg, name):
+        self._run_cmd(name); return
+      d, cmd = cwd(), command(self.cfg, "_list", colour = False)
+      def done(res):
+        files, e = res
+        if e is None:
+          self._run_cmd(name, lambda n: self.choose_filespec(files, n))
+        else:
+          self.win.term.clear()
+          self.win.term.header("# listing failed: {}\n".format(e))
+      self.sched.submit(
+        ("list", d),
+        lambda token: try_list_files(cmd, d, LISTTIMEOUT, token), done
       )
 
-    def _iterdir(self, d):
-      return ( x for x in d.iterdir()
-               if self.cfg["m_options"].get("show-hidden")
-               or not x.name.startswith(".") )
-
-    def list(self):
-      cmd = command(self.cfg, "_list", colour = False)
-      out = subprocess.run(SHELLRUN + [cmd], check = True,
-                           universal_newlines = True,
-                           stdout = subprocess.PIPE).stdout
-      return out.rstrip("\n").split("\n")
+    def _run_cmd(self, name, filespec = None):
+      cmd = command_w_filespec(self.cfg, name, filespec)
+      if cmd is not None:
+        self.win.term.sh(cmd)
+        self.set_cmd_timeout(self.cfg["timeouts"].get(name))
+
+    # NB: called after the command was spawned; child-exited can't have
+    # been handled yet since we haven't returned to the main loop
+    def set_cmd_timeout(self, timeout):
+      if timeout and self.child is not None:
+        self.timeout_id = GLib.timeout_add_seconds(
+          int(timeout), self.on_cmd_timeout, self.child
+        )
                                                                 # }}}1
 
 # === functions ===
@@ -514,7 +990,7 @@ def main(*args):                                                # {{{1
   import_gtk(n.scale); define_classes()
   print("==> starting...")
   App(cfg, fullscreen = n.fullscreen or n.stay_fullscreen,
-      stay_fullscreen = n.stay_fullscreen).run()
+      stay_fullscreen = n.stay_fullscreen, debug = n.debug).run()
   print("==> bye.")
   return 0
                                                                 # }}}1
@@ -538,11 +1014,63 @@ def _argument_parser(cfg):                                      # {{{1
                  help   = "start and stay full screen")
   p.add_argument("--no-stay-fullscreen", "--no-stay-fs",
                  action = "store_false", dest = "stay_fullscreen")
+  p.add_argument("--debug", action = "store_true",
+                 help = "print scheduler stats (queue depth etc.)")
   return p
                                                                 # }}}1
 
 def info(*msgs): print(*msgs, file = sys.stderr)
 
+def mtime(d):
+  try:
+    return os.stat(d).st_mtime
+  except OSError:
+    return None
+
+def subdirs(d, hidden = False):
+  return sorted(
+    ( x.name for x in Path(d).iterdir()
+      if x.is_dir() and (hidden or not x.name.startswith(".")) ),
+    key = lambda x: x.lower()                                   # TODO
+  )
+
+# NB: we kill the whole process group on timeout (or cancellation),
+# otherwise e.g. m could keep stdout open and we'd still be waiting
+# for it; and a hung listing would keep a worker busy.
+def list_files(cmd, d, timeout = None, token = None):           # {{{1
+  deadline = timeout and time.time() + timeout
+  with subprocess.Popen(SHELLRUN + [cmd], cwd = d,
+                        stdout = subprocess.PIPE,
+                        start_new_session = True) as p:
+    while True:
+      try:
+        out, _ = p.communicate(timeout = LISTPOLL); break
+      except subprocess.TimeoutExpired as e:
+        cancelled = token is not None and token.cancelled
+        if cancelled or (deadline and time.time() > deadline):
+          with contextlib.suppress(ProcessLookupError):
+            os.killpg(p.pid, signal.SIGKILL)
+          if cancelled: raise Cancelled()
+          raise subprocess.TimeoutExpired(cmd, timeout) from e
+  if p.returncode != 0:
+    raise subprocess.CalledProcessError(p.returncode, cmd)
+  out = out.decode(locale.getpreferredencoding(False), "replace")
+  return out.rstrip("\n").split("\n")
+                                                                # }}}1
+
+def try_list_files(cmd, d, timeout = None, token = None):
+  try:
+    return list_files(cmd, d, timeout, token), None
+  except (OSError, ValueError, subprocess.SubprocessError,
+          Cancelled) as e:
+    return [], e
+
+# NB: assumes _list marks each file w/ a single character + space
+def file_status(cfg, line):
+  for k, v in cfg["marks"].items():
+    if line[:1] == v: return k
+  return None
+
 # ugly, but better than os.chdir(`cd ..; pwd`), right?!
 def dir_up(): return str(Path(cwd()).parent)
 
@@ -633,6 +1161,11 @@ MENU_XML_HEAD = """
           <attribute name="label" translatable="yes">Bookmark Current Directory</attribute>
           <attribute name="accel">&lt;#{MOD}&gt;b</attribute>
         </item>
+        <item>
+          <attribute name="action">app.whatsnew</attribute>
+          <attribute name="label" translatable="yes">_What's New (All Bookmarks)...</attribute>
+          <attribute name="accel">w</attribute>
+        </item>
       </section>
       <section>
         <item>
@@ -640,6 +1173,11 @@ MENU_XML_HEAD = """
           <attribute name="label" translatable="yes">Run _Shell</attribute>
           <attribute name="accel">dollar</attribute>
         </item>
+        <item>
+          <attribute name="action">app.cancel</attribute>
+          <attribute name="label" translatable="yes">_Cancel Running Command</attribute>
+          <attribute name="accel">&lt;#{MOD}&gt;Escape</attribute>
+        </item>
       </section>
       <section>
         <item>
@@ -694,6 +1232,28 @@ MENU_XML_FOOT = """
           <attribute name="accel">End</attribute>
         </item>
       </section>
+      <section>
+        <item>
+          <attribute name="action">app.search</attribute>
+          <attribute name="label" translatable="yes">_Search...</attribute>
+          <attribute name="accel">slash</attribute>
+        </item>
+        <item>
+          <attribute name="action">app.searchnext</attribute>
+          <attribute name="label" translatable="yes">Find Next</attribute>
+          <attribute name="accel">F3</attribute>
+        </item>
+        <item>
+          <attribute name="action">app.searchprev</attribute>
+          <attribute name="label" translatable="yes">Find Previous</attribute>
+          <attribute name="accel">&lt;#{MOD}&gt;F3</attribute>
+        </item>
+        <item>
+          <attribute name="action">app.searchhistory</attribute>
+          <attribute name="label" translatable="yes">Search _History...</attribute>
+          <attribute name="accel">h</attribute>
+        </item>
+      </section>
       <section>
         <item>
           <attribute name="action">app.fullscreen</attribute>
@@ -0,0 +1,69 @@
+import importlib, random, sys, unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+m_gui = importlib.import_module("m-gui")
+
+WORDS = "the quick brown fox jumps over lazy dog İstanbul ǅ ß".split()
+
+def brute(lines, first, q):
+  return [ n for n, x in enumerate(lines)
+           if n >= first and q.lower() in x.lower() ]
+
+class TestHistory(unittest.TestCase):
+
+  def setUp(self):
+    rnd = random.Random(42)
+    self.lines = [ "{} {}".format(i, " ".join( rnd.choice(WORDS)
+                                              for _ in range(3) ))
+                   for i in range(5000) ]
+
+  def history(self, **kwargs):
+    h = m_gui.History(**kwargs)
+    for i in range(0, len(self.lines), 97):
+      h.add(self.lines[i:i+97])
+    return h
+
+  def test_line(self):
+    h = self.history(chunk = 64)
+    for n in (0, 63, 64, 4999): self.assertEqual(h.line(n), self.lines[n])
+    self.assertIsNone(h.line(5000))
+
+  def test_search_vs_brute_force(self):
+    h = self.history(chunk = 64)
+    for q in "İ i̇ istanbul fox jumps 12 ǆ SS ß zzz".split() + ["s b"]:
+      ms, complete = h.search(q, limit = 10**6)
+      self.assertTrue(complete)
+      self.assertEqual(ms, brute(self.lines, 0, q), q)
+
+  def test_incremental(self):
+    h = self.history(chunk = 64)
+    for q in ["l", "la", "laz", "lazy", "lazy d", "lazy", "fox", "fox "]:
+      ms, complete = h.search(q, limit = 10**6)
+      self.assertEqual(ms, brute(self.lines, 0, q), q)
+    h.add(["a lazy dog", "more text"]); self.lines += ["a lazy dog",
+                                                        "more text"]
+    ms, _ = h.search("fox j", limit = 10**6)
+    self.assertEqual(ms, brute(self.lines, 0, "fox j"))
+    ms, _ = h.search("lazy", limit = 10**6)
+    self.assertEqual(ms, brute(self.lines, 0, "lazy"))
+
+  def test_limit(self):
+    h = self.history(chunk = 64)
+    ms, complete = h.search("the", limit = 10)
+    self.assertFalse(complete)
+    self.assertEqual(ms, brute(self.lines, 0, "the")[:10])
+    ms, complete = h.search("the q", limit = 10**6)
+    self.assertEqual(ms, brute(self.lines, 0, "the q"))
+
+  def test_maxlines(self):
+    h = self.history(chunk = 64, maxlines = 1000)
+    self.assertGreater(h.first, 0)
+    self.assertGreaterEqual(len(h), 1000)
+    self.assertIsNone(h.line(h.first - 1))
+    ms, _ = h.search("fox", limit = 10**6)
+    self.assertEqual(ms, brute(self.lines, h.first, "fox"))
+
+if __name__ == "__main__":
+  unittest.main()
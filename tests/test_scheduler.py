@@ -0,0 +1,93 @@
+import importlib, sys, threading, time, unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+m_gui = importlib.import_module("m-gui")
+
+WAIT = 5  # seconds
+
+class TestScheduler(unittest.TestCase):
+
+  def setUp(self):
+    self.idle, self.lock = [], threading.Lock()
+    self.sched = m_gui.Scheduler(self.idle_add, workers = 1)
+    self.block()
+
+  def tearDown(self):
+    self.unblock.set()
+
+  def idle_add(self, f, *args):
+    with self.lock: self.idle.append((f, args))
+
+  # NB: keeps the (single) worker busy so we can queue up jobs
+  def block(self):
+    self.unblock, started = threading.Event(), threading.Event()
+    self.sched.submit("block", lambda _: (started.set(),
+                                          self.unblock.wait()))
+    self.assertTrue(started.wait(WAIT))
+
+  def run_idle(self, n):
+    """Waits for n main loop callbacks and runs them."""
+    t = time.time()
+    while len(self.idle) < n:
+      self.assertLess(time.time() - t, WAIT); time.sleep(0.01)
+    with self.lock: idle, self.idle = self.idle[:n], self.idle[n:]
+    for f, args in idle: f(*args)
+
+  def test_priority(self):
+    out = []
+    for k, prio in [("a", 10), ("b", 0), ("c", 5), ("d", 0)]:
+      self.sched.submit(k, lambda _, k = k: out.append(k) or k,
+                        prio = prio)
+    self.unblock.set(); self.run_idle(5)
+    self.assertEqual(out, ["b", "d", "c", "a"])
+
+  def test_dedup_and_promote(self):
+    out, res = [], []
+    f = lambda _: out.append("p") or "p"
+    self.sched.submit("p", f, res.append, prio = m_gui.PRIO_PREFETCH)
+    self.sched.submit("x", lambda _: out.append("x") or "x",
+                      prio = m_gui.PRIO_PREFETCH)
+    job = self.sched.submit("p", f, res.append)
+    self.assertEqual(job.prio, m_gui.PRIO_USER)
+    self.assertEqual(self.sched.stats()["queued"], 2)
+    self.unblock.set(); self.run_idle(3)
+    self.assertEqual(out, ["p", "x"])      # ran once, promoted
+    self.assertEqual(res, ["p", "p"])      # both callbacks
+    time.sleep(0.1)                        # stale entry: not run
+    self.assertEqual(out, ["p", "x"]); self.assertEqual(self.idle, [])
+
+  def test_cancel(self):
+    res, token = [], m_gui.Token()
+    self.sched.submit("a", lambda _: "a", res.append)
+    self.sched.submit("own", lambda _: "own", res.append, token = token)
+    self.sched.cancel()
+    job = self.sched.submit("a", lambda _: "a2", res.append)
+    self.assertFalse(job.token.cancelled)  # new job, not the cancelled
+    self.unblock.set(); self.run_idle(4)
+    self.assertEqual(sorted(res), ["a2", "own"])
+
+  def test_cancel_between_callbacks(self):
+    res = []
+    def first(x): res.append(x); self.sched.cancel()
+    self.sched.submit("a", lambda _: 1, first)
+    self.sched.submit("a", lambda _: 1, res.append)
+    self.unblock.set(); self.run_idle(2)
+    self.assertEqual(res, [1])
+
+  def test_token_passed(self):
+    res = []
+    self.sched.submit("a", lambda token: token.cancelled, res.append)
+    self.unblock.set(); self.run_idle(2)
+    self.assertEqual(res, [False])
+
+  def test_error(self):
+    res = []
+    self.sched.submit("a", lambda _: 1 // 0, res.append)
+    self.unblock.set(); self.run_idle(2)
+    self.assertEqual(res, [])
+    self.assertEqual(self.sched.stats()["running"], 0)
+
+if __name__ == "__main__":
+  unittest.main()